@@ -1,17 +1,25 @@
 import os
+import atexit
 import time
+import asyncio
 import threading
 import logging
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 from bs4 import BeautifulSoup
 import json
 import base64
-from datetime import datetime, timezone
-from flask import Flask
-from pymongo import MongoClient
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from datetime import datetime, timedelta, timezone
+from aiohttp import web
+from pymongo import MongoClient, UpdateOne, ReplaceOne, DeleteMany
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackContext, CallbackQueryHandler
+from telegram.constants import ParseMode
 from understatapi import UnderstatClient
 
 logging.basicConfig(level=logging.INFO)
@@ -23,6 +31,15 @@ HIGH_OWNERSHIP_THRESHOLD = 16.0
 SOFASCORE_BASE_URL = "https://api.sofascore.com/api/v1"
 PL_TOURNAMENT_ID = 17
 PL_SEASON_ID = 76986
+PLAYER_CACHE_TTL = 3600
+EVENTS_CACHE_TTL = 300  # monitor ticks every 60s; keeps kickoff changes and SofaScore outages short-lived
+SOFASCORE_CONCURRENCY = 4
+SOFASCORE_RETRY_BACKOFF = 2  # seconds before the 2nd lineup attempt, doubling after
+MENU_CACHE_TTL = 60
+STATUS_CACHE_TTL = 30
+REPORT_CACHE_TTL = 180
+UNDERSTAT_SEASON = "2025"
+UNDERSTAT_CACHE_TTL = 1800
 
 SOFASCORE_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
@@ -51,20 +68,153 @@ TEAM_NAME_MAP = {
     "Nottingham Forest": "Nottingham Forest",
 }
 
+# FPL element_type -> position code
+FPL_POSITIONS = {1: 'GK', 2: 'DEF', 3: 'MID', 4: 'FWD'}
+
+# Position sets used by the OOP and shot-player checks
+ATTACKING_POSITIONS = frozenset({'FWD', 'MID'})
+DEFENSIVE_SLOTS = frozenset({'DEF', 'GK'})
+# FPL position -> SofaScore slots that count as a shift (DEF: anything outside DEFENSIVE_SLOTS)
+OOP_SLOTS = {
+    'MID': frozenset({'FWD'}),
+    'FWD': frozenset({'MID', 'DEF'}),
+}
+
+# --- HTTP SESSION ---
+def pooled_session(headers=None):
+    """Keep-alive session with retries on idempotent requests; POSTs are never retried"""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=20,
+        pool_maxsize=50,
+        max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    ))
+    if headers:
+        session.headers.update(headers)
+    return session
+
+# FPL and Telegram calls
+SESSION = pooled_session()
+# SofaScore calls carry the browser headers on every request
+SOFASCORE_SESSION = pooled_session(SOFASCORE_HEADERS)
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available"""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - 1
+            self.updated = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+# Paces SofaScore calls across /update workers and the monitor thread
+SOFASCORE_BUCKET = TokenBucket(rate=2, burst=4)
+
+def get_json(url, **kwargs):
+    return orjson.loads(SESSION.get(url, **kwargs).content)
+
 # --- MONGO HELPER ---
+# lowercased name -> (fetched_at, projected FPL player doc or None); /update clears it
+_player_cache = {}
+
+def find_fpl_players(db, names):
+    """FPL players by SofaScore name, keyed by lowercased name; one indexed $in query for cache misses"""
+    now = time.time()
+    found, missing = {}, set()
+    for name in names:
+        key = name.lower()
+        entry = _player_cache.get(key)
+        if entry and now - entry[0] < PLAYER_CACHE_TTL:
+            found[key] = entry[1]
+        else:
+            missing.add(key)
+    if missing:
+        fetched = {
+            doc['web_name_lc']: doc
+            for doc in db.players.find(
+                {"web_name_lc": {"$in": list(missing)}},
+                {"web_name": 1, "web_name_lc": 1, "position": 1, "minutes": 1, "_id": 0}
+            )
+        }
+        for key in missing:
+            found[key] = fetched.get(key)
+            _player_cache[key] = (now, found[key])
+    return found
+
+# One client per process: PyMongo pools connections internally and is thread-safe.
+# Sized for the default to_thread workers plus the monitor and its broadcast pool.
+MONGO_MAX_POOL_SIZE = 50
+# Kept open between commands so the first query after an idle spell skips the handshake
+MONGO_MIN_POOL_SIZE = 5
+_CLIENT = MongoClient(MONGODB_URI, tz_aware=True,
+                      minPoolSize=MONGO_MIN_POOL_SIZE, maxPoolSize=MONGO_MAX_POOL_SIZE)
+_DB = _CLIENT['premier_league']
+atexit.register(_CLIENT.close)
+
 def get_db():
-    client = MongoClient(MONGODB_URI)
-    db = client['premier_league']
-    return client, db
+    return _DB
+
+def ensure_indexes(db):
+    """Idempotent; run once at startup"""
+    db.tactical_data.create_index("match_id", unique=True)
+    # /status and /check: most recently updated lineup
+    db.tactical_data.create_index([("last_updated", -1)])
+    db.players.create_index("web_name_lc")
+    db.players.create_index("selected_by_percent")
+    db.fixtures.create_index("id", unique=True)
+    # load_results: finished fixtures, newest first
+    db.fixtures.create_index([("finished", 1), ("kickoff_time", -1)])
+    # run_monitor: fixtures kicking off around now
+    db.fixtures.create_index("kickoff_dt")
+    # /status upcoming count (prefix) and get_next_fixtures' range + sort
+    db.fixtures.create_index([("started", 1), ("finished", 1), ("kickoff_dt", 1)])
+    # Covers the benched check's player_id/minutes read for a match
+    db.lineups.create_index([("match_id", 1), ("player_id", 1), ("minutes", 1)])
+    db.standings.create_index("team_name", unique=True)
+    db.users.create_index("chat_id")
+    # Backfill players stored before web_name_lc existed; /update writes it from then on
+    backfill = [
+        UpdateOne({'_id': p['_id']}, {'$set': {'web_name_lc': p['web_name'].lower()}})
+        for p in db.players.find({'web_name_lc': {'$exists': False}}, {'web_name': 1})
+    ]
+    if backfill:
+        db.players.bulk_write(backfill, ordered=False)
+    # Same for fixtures stored before kickoff_dt existed
+    backfill = [
+        UpdateOne({'_id': f['_id']}, {'$set': {'kickoff_dt': fixture_kickoff(f)}})
+        for f in db.fixtures.find({'kickoff_dt': {'$exists': False}, 'kickoff_time': {'$ne': None}},
+                                  {'kickoff_time': 1})
+    ]
+    if backfill:
+        db.fixtures.bulk_write(backfill, ordered=False)
+    # And standings saved before the per-game fields; recent totals cover the last min(6, played) games
+    played = {'$max': ['$played', 1]}
+    recent = {'$min': [6, played]}
+    db.standings.update_many({'xG_pg': {'$exists': False}}, [{'$set': {
+        'xG_pg': {'$divide': ['$xG', played]},
+        'xGA_pg': {'$divide': ['$xGA', played]},
+        'xPTS_pg': {'$divide': ['$xPTS', played]},
+        'xG_recent_pg': {'$divide': ['$xG_recent', recent]},
+        'xGA_recent_pg': {'$divide': ['$xGA_recent', recent]},
+        'xPTS_recent_pg': {'$divide': ['$xPTS_recent', recent]},
+    }}])
 
 def save_standings_to_mongo(db, rows):
     """Save PL standings to MongoDB"""
-    collection = db.standings
-    collection.delete_many({})
-
+    now = datetime.now(timezone.utc)
+    docs = []
     for row in rows:
         team = row["team"]
-        doc = {
+        docs.append({
             "team_id": team["id"],
             "team_name": team["name"],
             "position": row["position"],
@@ -83,24 +233,134 @@ def save_standings_to_mongo(db, rows):
             "xG_recent": row.get("xG_recent", 0.0),
             "xGA_recent": row.get("xGA_recent", 0.0),
             "xPTS_recent": row.get("xPTS_recent", 0.0),
-            "updated_at": datetime.now(timezone.utc),
+            "xG_pg": row.get("xG_pg", 1.0),
+            "xGA_pg": row.get("xGA_pg", 1.5),
+            "xPTS_pg": row.get("xPTS_pg", 0.0),
+            "xG_recent_pg": row.get("xG_recent_pg", 1.0),
+            "xGA_recent_pg": row.get("xGA_recent_pg", 1.5),
+            "xPTS_recent_pg": row.get("xPTS_recent_pg", 0.0),
+            "updated_at": now,
             "ppda_avg": row.get("ppda_avg", 20.0),
             "home_xG_pg": row.get("home_xG_pg", 1.0),
             "away_xG_pg": row.get("away_xG_pg", 1.0),
-        }
-        collection.insert_one(doc)
+        })
+
+    if docs:
+        # Replace in place so readers never see an empty table; drop teams no longer in the league
+        names = [d["team_name"] for d in docs]
+        db.standings.bulk_write(
+            [ReplaceOne({"team_name": d["team_name"]}, d, upsert=True) for d in docs]
+            + [DeleteMany({"team_name": {"$nin": names}})],
+            ordered=False
+        )
+    _report_cache.clear()
+
+# Fields kept from each FPL fixture
+FIXTURE_COLUMNS = ['id', 'event', 'team_h', 'team_a', 'kickoff_time',
+                   'started', 'finished', 'team_h_score', 'team_a_score']
+
+def save_fpl_data(db, bootstrap, fixtures_data):
+    """Replace players, fixtures and FPL minutes lineups from the FPL API payloads"""
+    players = pd.DataFrame(bootstrap['elements'])
+    players['position'] = players['element_type'].map(FPL_POSITIONS)
+    players['web_name_lc'] = players['web_name'].str.lower()
+
+    db.players.delete_many({})
+    db.players.insert_many(
+        players[['id', 'web_name', 'web_name_lc', 'position', 'minutes', 'team', 
+                'goals_scored', 'assists', 'total_points', 'selected_by_percent']].to_dict('records')
+    )
+    _player_cache.clear()
+
+    teams_df = pd.DataFrame(bootstrap['teams'])
+    team_map = dict(zip(teams_df['id'], teams_df['name']))
+
+    # object dtype keeps ids and scores as Python ints and missing values as None
+    fixtures_df = pd.DataFrame(fixtures_data, columns=FIXTURE_COLUMNS, dtype=object)
+    for side in ('team_h', 'team_a'):
+        fixtures_df[f'{side}_name'] = fixtures_df[side].map(team_map).fillna(fixtures_df[side].astype(str))
+    fixtures_df['kickoff_dt'] = pd.to_datetime(fixtures_df['kickoff_time'], utc=True)
+    fixtures = fixtures_df.astype(object).where(fixtures_df.notna(), None).to_dict('records')
+
+    db.fixtures.delete_many({})
+    db.fixtures.insert_many(fixtures)
+    _menu_cache['markup'] = None
+    _report_cache.clear()
+    _results_cache['results'] = None
+
+    lineup_entries = []
+    for f in fixtures_data:
+        for s in f.get('stats', []):
+            if s.get('identifier') == 'minutes':
+                for side in ('h', 'a'):
+                    for p in s.get(side, []):
+                        lineup_entries.append({
+                            "match_id": f['id'],
+                            "player_id": p['element'],
+                            "minutes": p['value']
+                        })
+
+    db.lineups.delete_many({})
+    if lineup_entries:
+        db.lineups.insert_many(lineup_entries)
+
+def save_tactical_lineups(db, event_lineups):
+    """Upsert (event, lineup) pairs into tactical_data in one bulk write; empty lineups are skipped"""
+    now = datetime.now(timezone.utc)
+    ops = [
+        UpdateOne(
+            {"match_id": event['id']},
+            {"$set": {
+                "home_team": event['homeTeam']['name'],
+                "away_team": event['awayTeam']['name'],
+                "players": lineup,
+                "last_updated": now
+            }},
+            upsert=True
+        )
+        for event, lineup in event_lineups if lineup
+    ]
+    if ops:
+        db.tactical_data.bulk_write(ops, ordered=False)
+        _report_cache.clear()
 
 # --- SOFASCORE FUNCTIONS ---
+# match_id -> Future for a lineup fetch already in progress
+_lineup_inflight = {}
+_lineup_inflight_lock = threading.Lock()
+
 def fetch_sofascore_lineup(match_id, retries=2):
+    """Concurrent calls for the same match (overlapping /update runs, the monitor) share one fetch"""
+    with _lineup_inflight_lock:
+        fut = _lineup_inflight.get(match_id)
+        owner = fut is None
+        if owner:
+            fut = _lineup_inflight[match_id] = Future()
+    if not owner:
+        return fut.result()
+    try:
+        fut.set_result(_fetch_sofascore_lineup(match_id, retries))
+    except Exception as e:
+        fut.set_exception(e)
+    finally:
+        with _lineup_inflight_lock:
+            del _lineup_inflight[match_id]
+    return fut.result()
+
+def _fetch_sofascore_lineup(match_id, retries):
     url = f"{SOFASCORE_BASE_URL}/event/{match_id}/lineups"
     for attempt in range(retries):
+        if attempt:
+            time.sleep(SOFASCORE_RETRY_BACKOFF * 2 ** (attempt - 1))
         try:
-            res = requests.get(url, headers=SOFASCORE_HEADERS, timeout=10)
+            SOFASCORE_BUCKET.acquire()
+            res = SOFASCORE_SESSION.get(url, timeout=10)
             logging.info(f"SofaScore lineup status: {res.status_code}, content: {res.text[:200]}...")  # Log partial response for debug
+            if res.status_code == 404:
+                return None  # lineups not published yet; retrying won't change that
             if res.status_code != 200:
-                time.sleep(2)
                 continue
-            data = res.json()
+            data = orjson.loads(res.content)
             players = []
             for side in ['home', 'away']:
                 team_data = data.get(side)
@@ -118,18 +378,39 @@ def fetch_sofascore_lineup(match_id, retries=2):
             return players
         except Exception as e:
             logging.error(f"SofaScore lineup error (attempt {attempt+1}): {e}")
-            time.sleep(2)
     return None
 
+# Dedicated workers so lineup fetches never tie up the default to_thread pool
+SOFASCORE_POOL = ThreadPoolExecutor(max_workers=SOFASCORE_CONCURRENCY, thread_name_prefix="sofascore")
+
+async def fetch_sofascore_lineups(events):
+    """Lineups for many events in order, at most SOFASCORE_CONCURRENCY in flight"""
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(
+        loop.run_in_executor(SOFASCORE_POOL, fetch_sofascore_lineup, e['id']) for e in events
+    ))
+
+# date -> (fetched_at, PL events); only today's entry is kept
+_events_cache = {}
+
 def get_today_sofascore_matches():
     date_str = datetime.now().strftime("%Y-%m-%d")
+    entry = _events_cache.get(date_str)
+    if entry and time.time() - entry[0] < EVENTS_CACHE_TTL:
+        return entry[1]
     url = f"{SOFASCORE_BASE_URL}/sport/football/scheduled-events/{date_str}"
     try:
-        res = requests.get(url, headers=SOFASCORE_HEADERS, timeout=10)
-        logging.info(f"SofaScore matches status: {res.status_code}, content length: {len(res.text)}")
-        data = res.json()
-        return [e for e in data.get('events', []) 
-                if e.get('tournament', {}).get('uniqueTournament', {}).get('id') == PL_TOURNAMENT_ID]
+        SOFASCORE_BUCKET.acquire()
+        res = SOFASCORE_SESSION.get(url, timeout=10)
+        logging.info(f"SofaScore matches status: {res.status_code}, content length: {len(res.content)}")
+        if res.status_code != 200:
+            return []
+        data = orjson.loads(res.content)
+        events = [e for e in data.get('events', []) 
+                  if e.get('tournament', {}).get('uniqueTournament', {}).get('id') == PL_TOURNAMENT_ID]
+        _events_cache.clear()
+        _events_cache[date_str] = (time.time(), events)
+        return events
     except Exception as e:
         logging.error(f"Error fetching matches: {e}")
         return []
@@ -137,125 +418,159 @@ def get_today_sofascore_matches():
 # --- ANALYSIS FUNCTIONS ---
 def detect_high_ownership_benched(match_id, db):
     try:
-        lineups = list(db.lineups.find({'match_id': int(match_id)}))
+        lineups = list(db.lineups.find({'match_id': int(match_id)}, {'player_id': 1, 'minutes': 1, '_id': 0}))
         if not lineups: return None
-        started_ids = {l['player_id'] for l in lineups if l.get('minutes', 0) > 0}
-        players = list(db.players.find({'selected_by_percent': {'$gte': HIGH_OWNERSHIP_THRESHOLD}}))
-        alerts = [f"🚨 {p['web_name']} — NOT STARTING" for p in players if p['id'] not in started_ids]
+        started_ids = [l['player_id'] for l in lineups if l.get('minutes', 0) > 0]
+        benched = db.players.find({'selected_by_percent': {'$gte': HIGH_OWNERSHIP_THRESHOLD},
+                                   'id': {'$nin': started_ids}},
+                                  {'web_name': 1, '_id': 0})
+        alerts = [f"🚨 {p['web_name']} — NOT STARTING" for p in benched]
         return "\n".join(alerts) if alerts else None
     except Exception as e:
         logging.error(f"Benched check error: {e}")
         return None
 
-def detect_tactical_oop(db, match_id_filter=None):
+def is_out_of_position(fpl_pos, sofa_pos):
+    if fpl_pos == 'DEF':
+        return sofa_pos not in DEFENSIVE_SLOTS
+    return sofa_pos in OOP_SLOTS.get(fpl_pos, ())
+
+def detect_tactical_oop(db, lineup):
+    """Shift lines for a SofaScore lineup (list of player dicts) already in hand"""
     try:
-        query = {"match_id": match_id_filter} if match_id_filter else {}
-        latest = db.tactical_data.find_one(query, sort=[("last_updated", -1)])
-        if not latest: return None
         insights = []
+        fpl_by_name = find_fpl_players(db, [p['name'] for p in lineup])
         
-        for p_sofa in latest.get('players', []):
-            fpl_p = db.players.find_one({"web_name": {"$regex": f"^{p_sofa['name']}$", "$options": "i"}})
+        for p_sofa in lineup:
+            fpl_p = fpl_by_name[p_sofa['name'].lower()]
             if fpl_p:
                 sofa_pos = p_sofa.get('tactical_pos', 'Unknown')
                 fpl_pos = fpl_p.get('position')
                 
-                is_oop = False
-                if fpl_pos == 'DEF' and sofa_pos not in ['DEF', 'GK']: is_oop = True
-                elif fpl_pos == 'MID' and sofa_pos == 'FWD': is_oop = True
-                elif fpl_pos == 'FWD' and sofa_pos in ['MID', 'DEF']: is_oop = True
-                
-                if is_oop:
+                if is_out_of_position(fpl_pos, sofa_pos):
                     insights.append(f"🔥 {p_sofa['name']} ({p_sofa['team']}): {fpl_pos} ➡️ {sofa_pos}")
         return "\n".join(insights) if insights else None
     except Exception as e:
         logging.error(f"OOP detection error: {e}")
         return None
 
+def build_check_report(db):
+    """Shift report for the most recently updated SofaScore lineup"""
+    tactical = db.tactical_data.find_one(
+        {}, {'home_team': 1, 'away_team': 1, 'players': 1, '_id': 0},
+        sort=[("last_updated", -1)]
+    )
+    if not tactical: return None
+    msg = f"📊 *{tactical['home_team']} vs {tactical['away_team']}*\n\n"
+    msg += detect_tactical_oop(db, tactical.get('players', [])) or "✅ No shifts"
+    return msg
+
+STATUS_TEMPLATE = (
+    "🤖 *Bot Status*\n\n"
+    "Players: {players}\n"
+    "Upcoming: {upcoming}\n"
+    "Users: {users}\n"
+    "Last update: {last_update}"
+)
+
+async def build_status_report(db):
+    """Status banner; its four independent reads run concurrently on worker threads"""
+    latest, players, upcoming, users = await asyncio.gather(
+        asyncio.to_thread(db.tactical_data.find_one, {}, {'last_updated': 1, '_id': 0},
+                          sort=[("last_updated", -1)]),
+        asyncio.to_thread(db.players.estimated_document_count),
+        asyncio.to_thread(db.fixtures.count_documents, {'started': False, 'finished': False}),
+        asyncio.to_thread(db.users.estimated_document_count),
+    )
+    if latest:
+        lu = latest['last_updated']
+        last_update = f"{lu.year:04d}-{lu.month:02d}-{lu.day:02d} {lu.hour:02d}:{lu.minute:02d} UTC"
+    else:
+        last_update = "Never"
+    return STATUS_TEMPLATE.format(players=players, upcoming=upcoming, users=users, last_update=last_update)
+
+def fixture_kickoff(f):
+    """Aware kickoff datetime; parses kickoff_time for fixtures synced before kickoff_dt existed"""
+    if ko := f.get('kickoff_dt'): return ko
+    if ko_time := f.get('kickoff_time'): return datetime.fromisoformat(ko_time)
+    return None
+
 def get_next_fixtures(db, limit=5):
-    now = datetime.now(timezone.utc)
-    upcoming = []
-    for f in db.fixtures.find({'started': False, 'finished': False}):
-        ko_time = f.get('kickoff_time')
-        if not ko_time: continue
-        ko = datetime.fromisoformat(ko_time.replace('Z', '+00:00'))
-        if ko > now:
-            upcoming.append((ko, f))
-    upcoming.sort(key=lambda x: x[0])
-    return upcoming[:limit]
+    """(kickoff, fixture) for the next `limit` kickoffs, sorted and limited on the kickoff_dt index"""
+    cursor = db.fixtures.find(
+        {'started': False, 'finished': False, 'kickoff_dt': {'$gt': datetime.now(timezone.utc)}},
+        {'id': 1, 'team_h_name': 1, 'team_a_name': 1, 'kickoff_dt': 1, '_id': 0}
+    ).sort('kickoff_dt', 1).limit(limit)
+    return [(f['kickoff_dt'], f) for f in cursor]
 
 # --- FORM HELPERS ---
-def get_home_form(team_id, db, last_n=6):
+# Results only change when /update rewrites fixtures, which resets this
+_results_cache = {'results': None}
+
+def load_results(db):
+    """Finished fixtures, newest first, with just the fields the form helpers read"""
+    if _results_cache['results'] is None:
+        _results_cache['results'] = list(db.fixtures.find(
+            {'finished': True},
+            {'team_h': 1, 'team_a': 1, 'team_h_score': 1, 'team_a_score': 1, '_id': 0}
+        ).sort('kickoff_time', -1))
+    return _results_cache['results']
+
+def get_home_form(team_id, results, last_n=6):
     """Points from last N home games"""
-    try:
-        home_games = list(db.fixtures.find({
-            'team_h': team_id,
-            'finished': True
-        }).sort('kickoff_time', -1).limit(last_n))
-        
-        points = 0
-        for f in home_games:
-            h_score, a_score = f.get('team_h_score'), f.get('team_a_score')
-            if h_score is None or a_score is None: continue
-            if h_score > a_score: points += 3
-            elif h_score == a_score: points += 1
-        return points
-    except Exception as e:
-        logging.error(f"Home form error: {e}")
-        return 0
+    points = 0
+    for f in islice((f for f in results if f['team_h'] == team_id), last_n):
+        h_score, a_score = f.get('team_h_score'), f.get('team_a_score')
+        if h_score is None or a_score is None: continue
+        if h_score > a_score: points += 3
+        elif h_score == a_score: points += 1
+    return points
 
-def get_away_form(team_id, db, last_n=6):
+def get_away_form(team_id, results, last_n=6):
     """Points from last N away games"""
-    try:
-        away_games = list(db.fixtures.find({
-            'team_a': team_id,
-            'finished': True
-        }).sort('kickoff_time', -1).limit(last_n))
-        
-        points = 0
-        for f in away_games:
-            h_score, a_score = f.get('team_h_score'), f.get('team_a_score')
-            if h_score is None or a_score is None: continue
-            if a_score > h_score: points += 3
-            elif a_score == h_score: points += 1
-        return points
-    except Exception as e:
-        logging.error(f"Away form error: {e}")
-        return 0
+    points = 0
+    for f in islice((f for f in results if f['team_a'] == team_id), last_n):
+        h_score, a_score = f.get('team_h_score'), f.get('team_a_score')
+        if h_score is None or a_score is None: continue
+        if a_score > h_score: points += 3
+        elif a_score == h_score: points += 1
+    return points
 
-def get_h2h_edge(home_id, away_id, db, last_n=5):
+def get_h2h_edge(home_id, away_id, results, last_n=5):
     """H2H edge for home team"""
-    try:
-        h2h = db.fixtures.find({
-            '$or': [
-                {'team_h': home_id, 'team_a': away_id},
-                {'team_h': away_id, 'team_a': home_id}
-            ],
-            'finished': True
-        }).sort('kickoff_time', -1).limit(last_n)
+    pair = {home_id, away_id}
+    edge = 0
+    for f in islice((f for f in results if {f['team_h'], f['team_a']} == pair), last_n):
+        h_score, a_score = f.get('team_h_score'), f.get('team_a_score')
+        if h_score is None or a_score is None: continue
         
-        edge = 0
-        for f in h2h:
-            h_score, a_score = f.get('team_h_score'), f.get('team_a_score')
-            if h_score is None or a_score is None: continue
-            
-            if (f['team_h'] == home_id and h_score > a_score) or \
-               (f['team_a'] == home_id and a_score > h_score):
-                edge += 0.5
-            elif h_score != a_score:
-                edge -= 0.5
-        return edge
-    except Exception as e:
-        logging.error(f"H2H error: {e}")
-        return 0
+        if (f['team_h'] == home_id and h_score > a_score) or \
+           (f['team_a'] == home_id and a_score > h_score):
+            edge += 0.5
+        elif h_score != a_score:
+            edge -= 0.5
+    return edge
 
 # --- UNDERSTAT STANDINGS ---
-def fetch_pl_standings():
+# Built once so its HTTP session stays warm across /update_standings runs
+UNDERSTAT = UnderstatClient()
+
+# season -> (fetched_at, parsed team data); repeated refreshes reuse the scrape
+_understat_cache = {}
+
+def get_understat_team_data(season=UNDERSTAT_SEASON, force=False):
+    """Parsed Understat team data; force=True always re-scrapes (explicit refreshes)"""
+    entry = _understat_cache.get(season)
+    if not force and entry and time.time() - entry[0] < UNDERSTAT_CACHE_TTL:
+        return entry[1]
+    team_data = UNDERSTAT.league(league="EPL").get_team_data(season=season)
+    _understat_cache[season] = (time.time(), team_data)
+    return team_data
+
+def fetch_pl_standings(force=False):
     """Fetch PL standings from Understat with xG stats"""
     try:
-        understat = UnderstatClient()
-        league = understat.league(league="EPL")
-        team_data = league.get_team_data(season="2025")
+        team_data = get_understat_team_data(force=force)
 
         rows = []
         for team_id, team_info in team_data.items():
@@ -264,30 +579,39 @@ def fetch_pl_standings():
             if not history: continue
 
             M = len(history)
-            W = sum(1 for h in history if h.get('wins') == 1)
-            D = sum(1 for h in history if h.get('draws') == 1)
-            L = sum(1 for h in history if h.get('loses') == 1)
-            G = sum(h.get('scored', 0) for h in history)
-            GA = sum(h.get('missed', 0) for h in history)
-            PTS = sum(h.get('pts', 0) for h in history)
-
-            xG_total = sum(float(h.get('xG', 0)) for h in history)
-            xGA_total = sum(float(h.get('xGA', 0)) for h in history)
+            W = D = L = G = GA = PTS = 0
+            xG_total = xGA_total = xPTS_total = ppda_total = 0.0
+            home_xG = away_xG = 0.0
+            home_matches = away_matches = 0
+            recent_xG = recent_xGA = recent_xPTS = 0.0
+            recent_from = max(M - 6, 0)
+            for i, h in enumerate(history):
+                xg, xga, xpts = float(h.get('xG', 0)), float(h.get('xGA', 0)), float(h.get('xpts', 0))
+                W += h.get('wins') == 1
+                D += h.get('draws') == 1
+                L += h.get('loses') == 1
+                G += h.get('scored', 0)
+                GA += h.get('missed', 0)
+                PTS += h.get('pts', 0)
+                xG_total += xg
+                xGA_total += xga
+                xPTS_total += xpts
+                ppda_total += float(h.get('ppda', {}).get('def', 20.0))
+                if i >= recent_from:
+                    recent_xG += xg
+                    recent_xGA += xga
+                    recent_xPTS += xpts
+                if h.get('h_a') == 'h':
+                    home_xG += xg
+                    home_matches += 1
+                elif h.get('h_a') == 'a':
+                    away_xG += xg
+                    away_matches += 1
             xGD = xG_total - xGA_total
-            xPTS_total = sum(float(h.get('xpts', 0)) for h in history)
-            ppda_avg = sum(float(h.get('ppda', {}).get('def', 20.0)) for h in history) / max(M, 1)
-
-            recent_history = history[-6:] if len(history) >= 6 else history
-            recent_xG = sum(float(h.get('xG', 0)) for h in recent_history)
-            recent_xGA = sum(float(h.get('xGA', 0)) for h in recent_history)
-            recent_xPTS = sum(float(h.get('xpts', 0)) for h in recent_history)
-
-            home_history = [h for h in history if h.get('h_a') == 'h']
-            away_history = [h for h in history if h.get('h_a') == 'a']
-            home_xG = sum(float(h.get('xG', 0)) for h in home_history)
-            away_xG = sum(float(h.get('xG', 0)) for h in away_history)
-            home_matches = len(home_history) or 1
-            away_matches = len(away_history) or 1
+            ppda_avg = ppda_total / max(M, 1)
+            home_matches = home_matches or 1
+            away_matches = away_matches or 1
+            recent_M = M - recent_from
 
             rows.append({
                 "team": {"id": team_id, "name": name},
@@ -307,6 +631,12 @@ def fetch_pl_standings():
                 "xG_recent": round(recent_xG, 2),
                 "xGA_recent": round(recent_xGA, 2),
                 "xPTS_recent": round(recent_xPTS, 2),
+                "xG_pg": round(xG_total / M, 3),
+                "xGA_pg": round(xGA_total / M, 3),
+                "xPTS_pg": round(xPTS_total / M, 3),
+                "xG_recent_pg": round(recent_xG / recent_M, 3),
+                "xGA_recent_pg": round(recent_xGA / recent_M, 3),
+                "xPTS_recent_pg": round(recent_xPTS / recent_M, 3),
                 "home_xG_pg": round(home_xG / home_matches, 2),
                 "away_xG_pg": round(away_xG / away_matches, 2),
                 "played": M
@@ -322,26 +652,36 @@ def fetch_pl_standings():
         raise
 
 # --- BET BUILDER FUNCTIONS ---
-def evaluate_team_result(fixture, db):
+# Standings fields read by the builder and accumulator models
+STANDINGS_PROJECTION = {
+    field: 1 for field in (
+        'team_name', 'position', 'xG', 'xGD', 'xG_pg',
+        'xG_recent_pg', 'xGA_recent_pg', 'xPTS_recent_pg', 'ppda_avg', 'home_xG_pg', 'away_xG_pg',
+    )
+} | {'_id': 0}
+
+def load_standings(db, team_names=None):
+    """Standings docs keyed by team_name, in one query (all teams when team_names is None)"""
+    query = {} if team_names is None else {"team_name": {"$in": list(team_names)}}
+    return {s['team_name']: s for s in db.standings.find(query, STANDINGS_PROJECTION)}
+
+def fixture_standings(fixture, standings):
+    """(home, away) standings docs for an FPL fixture; None where Understat has no row"""
+    home_name, away_name = fixture['team_h_name'], fixture['team_a_name']
+    return (standings.get(TEAM_NAME_MAP.get(home_name, home_name)),
+            standings.get(TEAM_NAME_MAP.get(away_name, away_name)))
+
+def evaluate_team_result(fixture, home_data, away_data):
     """ADDED: Missing function to evaluate match result"""
     try:
         home_name = fixture['team_h_name']
         away_name = fixture['team_a_name']
         
-        home_ustat = TEAM_NAME_MAP.get(home_name, home_name)
-        away_ustat = TEAM_NAME_MAP.get(away_name, away_name)
-        
-        home_data = db.standings.find_one({"team_name": home_ustat})
-        away_data = db.standings.find_one({"team_name": away_ustat})
-        
         if not home_data or not away_data:
             return "Skip (no data)"
         
-        home_played = home_data.get('played', 1)
-        away_played = away_data.get('played', 1)
-        
-        home_xg_pg = home_data.get('xG', 1.0) / max(home_played, 1)
-        away_xg_pg = away_data.get('xG', 1.0) / max(away_played, 1)
+        home_xg_pg = home_data.get('xG_pg', 1.0)
+        away_xg_pg = away_data.get('xG_pg', 1.0)
         
         # Add home advantage
         home_xg_expected = home_xg_pg + 0.3
@@ -358,25 +698,13 @@ def evaluate_team_result(fixture, db):
         logging.error(f"Result eval error: {e}")
         return "Skip"
 
-def evaluate_btts(fixture, db):
+def evaluate_btts(home_data, away_data):
     try:
-        home_name = fixture['team_h_name']
-        away_name = fixture['team_a_name']
-        
-        home_ustat = TEAM_NAME_MAP.get(home_name, home_name)
-        away_ustat = TEAM_NAME_MAP.get(away_name, away_name)
-        
-        home_data = db.standings.find_one({"team_name": home_ustat})
-        away_data = db.standings.find_one({"team_name": away_ustat})
-        
         if not home_data or not away_data:
             return "Skip (no xG data)"
         
-        home_matches = home_data.get('played', 1)
-        away_matches = away_data.get('played', 1)
-        
-        home_xg_pg = home_data.get('xG', 1.0) / max(home_matches, 1)
-        away_xg_pg = away_data.get('xG', 1.0) / max(away_matches, 1)
+        home_xg_pg = home_data.get('xG_pg', 1.0)
+        away_xg_pg = away_data.get('xG_pg', 1.0)
         
         if home_xg_pg >= 1.3 and away_xg_pg >= 1.3:
             return "Yes"
@@ -387,13 +715,13 @@ def evaluate_btts(fixture, db):
         logging.error(f"BTTS error: {e}")
         return "Skip"
 
-def select_shot_player(team_name, lineup, db):
+def select_shot_player(team_name, lineup, fpl_by_name):
     for p in lineup:
-        if p['team'] == team_name:
-            fpl_p = db.players.find_one({"web_name": {"$regex": f"^{p['name']}$", "$options": "i"}})
-            if fpl_p and fpl_p.get('position') in ['FWD', 'MID'] and fpl_p.get('minutes', 0) > 0:
-                if p.get('tactical_pos') in ['FWD', 'MID']:
-                    return p['name']
+        if p['team'] != team_name: continue
+        fpl_p = fpl_by_name.get(p['name'].lower())
+        if fpl_p and fpl_p.get('position') in ATTACKING_POSITIONS and fpl_p.get('minutes', 0) > 0:
+            if p.get('tactical_pos') in ATTACKING_POSITIONS:
+                return p['name']
     return None
 
 def generate_fixture_bet_builder(fixture, db):
@@ -406,13 +734,12 @@ def generate_fixture_bet_builder(fixture, db):
         home_ustat = TEAM_NAME_MAP.get(home_name, home_name)
         away_ustat = TEAM_NAME_MAP.get(away_name, away_name)
         
-        home_data = db.standings.find_one({"team_name": home_ustat})
-        away_data = db.standings.find_one({"team_name": away_ustat})
+        home_data, away_data = fixture_standings(fixture, load_standings(db, (home_ustat, away_ustat)))
         
-        result = evaluate_team_result(fixture, db)
+        result = evaluate_team_result(fixture, home_data, away_data)
         builder.append(f"• Result: {result}")
         
-        btts = evaluate_btts(fixture, db)
+        btts = evaluate_btts(home_data, away_data)
         builder.append(f"• BTTS: {btts}")
         
         if home_data and away_data:
@@ -422,12 +749,14 @@ def generate_fixture_bet_builder(fixture, db):
                 f"({away_data['xGD']:+.2f})"
             )
         
-        sofa_data = db.tactical_data.find_one({"match_id": fixture.get('sofascore_id')})
+        sofa_data = db.tactical_data.find_one({"match_id": fixture.get('sofascore_id')}, {'players': 1, '_id': 0})
         if sofa_data:
             lineup = sofa_data.get('players', [])
-            if home_player := select_shot_player(home_name, lineup, db):
+            # One lookup for both teams; names are deduplicated before querying
+            fpl_by_name = find_fpl_players(db, {p['name'] for p in lineup})
+            if home_player := select_shot_player(home_name, lineup, fpl_by_name):
                 builder.append(f"• {home_player} 1+ SOT")
-            if away_player := select_shot_player(away_name, lineup, db):
+            if away_player := select_shot_player(away_name, lineup, fpl_by_name):
                 builder.append(f"• {away_player} 1+ SOT")
         
         return "\n".join(builder)
@@ -443,13 +772,19 @@ def generate_gw_accumulator(db, top_n=6):
             'started': False,
             'finished': False,
             'event': {'$ne': None}
-        }).sort('kickoff_time', 1))
+        }, {'team_h': 1, 'team_a': 1, 'team_h_name': 1, 'team_a_name': 1, 'event': 1, '_id': 0}
+        ).sort('kickoff_time', 1))
         
         if upcoming:
             next_event = min(f['event'] for f in upcoming if f['event'] is not None)
             upcoming = [f for f in upcoming if f['event'] == next_event]
         
         accumulator = []
+        standings = load_standings(db, {
+            TEAM_NAME_MAP.get(name, name)
+            for f in upcoming for name in (f['team_h_name'], f['team_a_name'])
+        })
+        results = load_results(db)
         
         for f in upcoming:
             try:
@@ -458,47 +793,37 @@ def generate_gw_accumulator(db, top_n=6):
                 home_id = f['team_h']
                 away_id = f['team_a']
                 
-                home_ustat = TEAM_NAME_MAP.get(home_name, home_name)
-                away_ustat = TEAM_NAME_MAP.get(away_name, away_name)
-                
-                home_stand = db.standings.find_one({"team_name": home_ustat})
-                away_stand = db.standings.find_one({"team_name": away_ustat})
+                home_stand, away_stand = fixture_standings(f, standings)
                 
                 if not home_stand or not away_stand:
                     continue
                 
-                home_played = home_stand.get('played', 1)
-                away_played = away_stand.get('played', 1)
-                
-                home_xg_pg = home_stand.get('xG_recent', home_stand.get('xG', 1.0)) / min(6, home_played)
-                away_xg_pg = away_stand.get('xG_recent', away_stand.get('xG', 1.0)) / min(6, away_played)
-                home_xga_pg = home_stand.get('xGA_recent', home_stand.get('xGA', 1.5)) / min(6, home_played)
-                away_xga_pg = away_stand.get('xGA_recent', away_stand.get('xGA', 1.5)) / min(6, away_played)
-                
-                home_xg_pg = home_stand.get('home_xG_pg', home_xg_pg)
-                away_xg_pg = away_stand.get('away_xG_pg', away_xg_pg)
+                home_xg_pg = home_stand.get('home_xG_pg', home_stand.get('xG_recent_pg', 1.0))
+                away_xg_pg = away_stand.get('away_xG_pg', away_stand.get('xG_recent_pg', 1.0))
+                home_xga_pg = home_stand.get('xGA_recent_pg', 1.5)
+                away_xga_pg = away_stand.get('xGA_recent_pg', 1.5)
                 
                 home_xg_expected = (home_xg_pg + 0.45) * (1 - (away_xga_pg / 2.0))
                 away_xg_expected = away_xg_pg * (1 - (home_xga_pg / 2.0))
                 xg_diff = home_xg_expected - away_xg_expected
                 
-                home_xpts_pg = home_stand.get('xPTS_recent', home_stand.get('xPTS', 0)) / min(6, home_played)
-                away_xpts_pg = away_stand.get('xPTS_recent', away_stand.get('xPTS', 0)) / min(6, away_played)
+                home_xpts_pg = home_stand.get('xPTS_recent_pg', 0.0)
+                away_xpts_pg = away_stand.get('xPTS_recent_pg', 0.0)
                 xpts_diff = home_xpts_pg - away_xpts_pg
                 
                 home_ppda = home_stand.get('ppda_avg', 20.0)
                 away_ppda = away_stand.get('ppda_avg', 20.0)
                 ppda_bonus = (away_ppda - home_ppda) * 0.05
                 
-                home_form = get_home_form(home_id, db)
-                away_form = get_away_form(away_id, db)
+                home_form = get_home_form(home_id, results)
+                away_form = get_away_form(away_id, results)
                 form_diff = home_form - away_form
                 
                 home_pos = home_stand.get('position', 10)
                 away_pos = away_stand.get('position', 10)
                 table_diff = away_pos - home_pos
                 
-                h2h = get_h2h_edge(home_id, away_id, db)
+                h2h = get_h2h_edge(home_id, away_id, results)
                 
                 final_strength = (
                     xg_diff * 1.5 +
@@ -548,6 +873,26 @@ def generate_gw_accumulator(db, top_n=6):
         logging.error(f"Accumulator error: {e}")
         return "Error generating accumulator."
 
+# fixture id -> (built_at, report); any write to fixtures, standings or lineups clears it
+_report_cache = {}
+
+def build_fixture_report(db, fixture_id):
+    """Bet builder message for a fixture id, or None if it is unknown"""
+    entry = _report_cache.get(fixture_id)
+    if entry and time.time() - entry[0] < REPORT_CACHE_TTL:
+        return entry[1]
+    msg = _build_fixture_report(db, fixture_id)
+    if msg:
+        _report_cache[fixture_id] = (time.time(), msg)
+    return msg
+
+def _build_fixture_report(db, fixture_id):
+    fixture = db.fixtures.find_one({"id": fixture_id}, {'team_h_name': 1, 'team_a_name': 1, 'sofascore_id': 1, '_id': 0})
+    if not fixture: return None
+    msg = f"📊 *{fixture['team_h_name']} vs {fixture['team_a_name']}*\n\n"
+    msg += generate_fixture_bet_builder(fixture, db)
+    return msg
+
 def show_fixture_menu(db):
     fixtures = get_next_fixtures(db, limit=10)
     return [
@@ -555,244 +900,297 @@ def show_fixture_menu(db):
         for _, f in fixtures
     ] or [[InlineKeyboardButton("No upcoming fixtures", callback_data="none")]]
 
+# Built fixture menu shared by /start and /builder; /update clears it
+_menu_cache = {'ts': 0.0, 'markup': None}
+
+def fixture_menu_markup(db):
+    if _menu_cache['markup'] is None or time.time() - _menu_cache['ts'] >= MENU_CACHE_TTL:
+        _menu_cache.update(ts=time.time(), markup=InlineKeyboardMarkup(show_fixture_menu(db)))
+    return _menu_cache['markup']
+
+# --- TELEGRAM BROADCAST ---
+# Telegram caps bots at ~30 messages/s across all chats; stay under it
+TELEGRAM_BUCKET = TokenBucket(rate=25, burst=25)
+TELEGRAM_MAX_CHARS = 4096
+
+def join_lines(lines, limit=TELEGRAM_MAX_CHARS):
+    """Newline-join whole lines up to Telegram's message cap, noting how many were dropped"""
+    kept, size = [], 0
+    for i, line in enumerate(lines):
+        size += len(line) + 1
+        if size > limit - 32:  # leave room for the truncation note
+            kept.append(f"…({len(lines) - i} more lines)")
+            break
+        kept.append(line)
+    return "\n".join(kept)
+
+def send_telegram_message(chat_id, text, retries=2):
+    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
+    for attempt in range(retries):
+        TELEGRAM_BUCKET.acquire()
+        res = SESSION.post(url, json={"chat_id": chat_id, "text": text, "parse_mode": ParseMode.MARKDOWN}, timeout=5)
+        if res.status_code != 429:
+            return res
+        retry_after = orjson.loads(res.content).get('parameters', {}).get('retry_after', 1)
+        logging.warning(f"Telegram rate limited, retrying in {retry_after}s")
+        time.sleep(retry_after)
+    return res
+
+# Overlaps broadcast round-trips; TELEGRAM_BUCKET still sets the overall rate
+BROADCAST_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="broadcast")
+
+def broadcast(chat_ids, text):
+    """Send text to every chat concurrently, logging per-chat failures"""
+    futures = {BROADCAST_POOL.submit(send_telegram_message, cid, text): cid for cid in chat_ids}
+    for fut, cid in futures.items():
+        try:
+            fut.result()
+        except Exception as e:
+            logging.error(f"Send failed for {cid}: {e}")
+
 # --- BACKGROUND MONITOR ---
-def run_monitor():
+def monitor_tick():
+    """One pass: alert every fixture in the lineup window that has not been alerted yet"""
+    db = get_db()
+    now = datetime.now(timezone.utc)
+
+    window = {'$gte': now - timedelta(minutes=60), '$lte': now + timedelta(minutes=61)}
+    fixtures = list(db.fixtures.find({'kickoff_dt': window, 'finished': False, 'alert_sent': {'$ne': True}},
+                                     {'id': 1, 'team_h_name': 1, 'team_a_name': 1, '_id': 0}))
+    if not fixtures:
+        return
+
+    sofa_events = get_today_sofascore_matches()
+    logging.info(f"Fetched {len(sofa_events)} SofaScore events")
+    events_by_teams = {
+        (e.get('homeTeam', {}).get('name', ''), e.get('awayTeam', {}).get('name', '')): e
+        for e in sofa_events
+    }
+
+    for f in fixtures:
+        logging.info(f"Checking: {f['team_h_name']} vs {f['team_a_name']}")
+        home_sofa = TEAM_NAME_MAP.get(f['team_h_name'], f['team_h_name'])
+        away_sofa = TEAM_NAME_MAP.get(f['team_a_name'], f['team_a_name'])
+        target_event = events_by_teams.get((home_sofa, away_sofa))
+
+        if target_event is None:
+            logging.warning(f"No matching SofaScore event for {f['team_h_name']} vs {f['team_a_name']}")
+
+        msg_parts = [f"📢 *Lineups Out: {f['team_h_name']} vs {f['team_a_name']}*"]
+        fixture_update = {'alert_sent': True}
+
+        if target_event:
+            logging.info(f"Matched {f['team_h_name']} vs {f['team_a_name']} to Sofa ID {target_event['id']}")
+            sofa_lineup = fetch_sofascore_lineup(target_event['id'])
+            if sofa_lineup:
+                save_tactical_lineups(db, [(target_event, sofa_lineup)])
+                fixture_update['sofascore_id'] = target_event['id']
+
+                if oop := detect_tactical_oop(db, sofa_lineup):
+                    msg_parts += ["", "*Tactical Shifts:*", *oop.split("\n")]
+
+        if benched := detect_high_ownership_benched(f['id'], db):
+            msg_parts += ["", "*Benched:*", *benched.split("\n")]
+
+        text = join_lines(msg_parts)
+        broadcast([u['chat_id'] for u in db.users.find({}, {'chat_id': 1, '_id': 0})], text)
+
+        # One write per alerted fixture, after the broadcast so a failed tick retries it
+        db.fixtures.update_one({'id': f['id']}, {'$set': fixture_update})
+        _report_cache.pop(f['id'], None)
+
+async def run_monitor():
     logging.info("Monitor started")
     while True:
+        await asyncio.sleep(60)
         try:
-            time.sleep(60)
-            client, db = get_db()
-            now = datetime.now(timezone.utc)
-            
-            sofa_events = get_today_sofascore_matches()
-            logging.info(f"Fetched {len(sofa_events)} SofaScore events")
-            
-            for f in db.fixtures.find({'kickoff_time': {'$exists': True}, 'finished': False, 'alert_sent': {'$ne': True}}):
-                ko = datetime.fromisoformat(f['kickoff_time'].replace('Z', '+00:00'))
-                diff_mins = (ko - now).total_seconds() / 60
-                
-                if -60 <= diff_mins <= 61:
-                    logging.info(f"Checking: {f['team_h_name']} vs {f['team_a_name']}")
-                    home_sofa = TEAM_NAME_MAP.get(f['team_h_name'], f['team_h_name'])
-                    away_sofa = TEAM_NAME_MAP.get(f['team_a_name'], f['team_a_name'])
-                    target_event = next((e for e in sofa_events 
-                                        if home_sofa == e.get('homeTeam', {}).get('name', '') 
-                                        and away_sofa == e.get('awayTeam', {}).get('name', '')), None)
-                    
-                    if target_event is None:
-                        logging.warning(f"No matching SofaScore event for {f['team_h_name']} vs {f['team_a_name']}")
-                    
-                    msg_parts = [f"📢 *Lineups Out: {f['team_h_name']} vs {f['team_a_name']}*"]
-                    
-                    if target_event:
-                        logging.info(f"Matched {f['team_h_name']} vs {f['team_a_name']} to Sofa ID {target_event['id']}")
-                        sofa_lineup = fetch_sofascore_lineup(target_event['id'])
-                        if sofa_lineup:
-                            db.tactical_data.update_one(
-                                {"match_id": target_event['id']},
-                                {"$set": {
-                                    "home_team": target_event['homeTeam']['name'],
-                                    "away_team": target_event['awayTeam']['name'],
-                                    "players": sofa_lineup,
-                                    "last_updated": datetime.now(timezone.utc)
-                                }},
-                                upsert=True
-                            )
-                            db.fixtures.update_one({'id': f['id']}, {'$set': {'sofascore_id': target_event['id']}})
-                            
-                            if oop := detect_tactical_oop(db, target_event['id']):
-                                msg_parts.append(f"\n*Tactical Shifts:*\n{oop}")
-                    
-                    if benched := detect_high_ownership_benched(f['id'], db):
-                        msg_parts.append(f"\n*Benched:*\n{benched}")
-                    
-                    for u in db.users.find():
-                        try:
-                            requests.post(
-                                f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
-                                json={"chat_id": u['chat_id'], "text": "\n".join(msg_parts), "parse_mode": "Markdown"},
-                                timeout=5
-                            )
-                        except Exception as e:
-                            logging.error(f"Send failed: {e}")
-                    
-                    db.fixtures.update_one({'id': f['id']}, {'$set': {'alert_sent': True}})
-            
-            client.close()
+            await asyncio.to_thread(monitor_tick)
         except Exception as e:
             logging.error(f"Monitor error: {e}")
 
+def start_monitor(application):
+    application.bot_data['monitor_task'] = asyncio.create_task(run_monitor())
+
+async def stop_monitor(application):
+    task = application.bot_data['monitor_task']
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
 # --- TELEGRAM COMMANDS ---
+START_TEXT = (
+    "👋 *Welcome to PL Lineup Bot!*\n\n"
+    "Commands:\n"
+    "/update - Sync FPL data\n"
+    "/check - Latest analysis\n"
+    "/builder - Bet builder\n"
+    "/gw_accumulator - Top bets\n"
+    "/status - Bot status\n"
+    "/update_standings - Update xG data"
+)
+
 async def start(update: Update, context: CallbackContext):
-    client, db = get_db()
+    db = get_db()
     user_id = update.effective_chat.id
-    db.users.update_one({'chat_id': user_id}, {'$set': {'chat_id': user_id, 'joined': datetime.now()}}, upsert=True)
-    
-    await update.message.reply_text(
-        "👋 *Welcome to PL Lineup Bot!*\n\n"
-        "Commands:\n"
-        "/update - Sync FPL data\n"
-        "/check - Latest analysis\n"
-        "/builder - Bet builder\n"
-        "/gw_accumulator - Top bets\n"
-        "/status - Bot status\n"
-        "/update_standings - Update xG data",
-        parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(show_fixture_menu(db))
+    await asyncio.to_thread(
+        db.users.update_one,
+        {'chat_id': user_id}, {'$set': {'chat_id': user_id, 'joined': datetime.now(timezone.utc)}}, upsert=True
     )
-    client.close()
+    markup = await asyncio.to_thread(fixture_menu_markup, db)
+    await update.message.reply_text(START_TEXT, parse_mode=ParseMode.MARKDOWN, reply_markup=markup)
+
+async def run_exclusive_job(update: Update, context: CallbackContext, name, job):
+    """Run job(update) as a background task so the handler returns at once; one run per name at a time"""
+    lock = context.bot_data.setdefault(f"{name}_lock", asyncio.Lock())
+    if lock.locked():
+        await update.message.reply_text("⏳ Already running, please wait.")
+        return
+    await lock.acquire()
+
+    async def runner():
+        try:
+            await job(update)
+        finally:
+            lock.release()
+
+    context.application.create_task(runner(), update=update)
+
+# key -> task for a read-only computation in progress; concurrent callers await the same one
+_inflight = {}
+
+async def single_flight(key, compute):
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(compute())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: one caller being cancelled must not cancel the shared work
+    return await asyncio.shield(task)
 
 async def update_data(update: Update, context: CallbackContext):
+    await run_exclusive_job(update, context, "update", sync_fpl_and_lineups)
+
+async def sync_fpl_and_lineups(update: Update):
     await update.message.reply_text("🔄 Syncing data...")
-    client, db = get_db()
+    db = get_db()
     try:
         base_url = "https://fantasy.premierleague.com/api/"
-        bootstrap = requests.get(f"{base_url}bootstrap-static/", timeout=30).json()
-        
-        players = pd.DataFrame(bootstrap['elements'])
-        players['position'] = players['element_type'].map({1: 'GK', 2: 'DEF', 3: 'MID', 4: 'FWD'})
-        
-        db.players.delete_many({})
-        db.players.insert_many(
-            players[['id', 'web_name', 'position', 'minutes', 'team', 
-                    'goals_scored', 'assists', 'total_points', 'selected_by_percent']].to_dict('records')
+        # Both FPL endpoints are independent; fetch them together off the event loop
+        bootstrap, fixtures_data = await asyncio.gather(
+            asyncio.to_thread(get_json, f"{base_url}bootstrap-static/", timeout=30),
+            asyncio.to_thread(get_json, f"{base_url}fixtures/", timeout=30)
         )
         
-        teams_df = pd.DataFrame(bootstrap['teams'])
-        team_map = dict(zip(teams_df['id'], teams_df['name']))
-        
-        fixtures_data = requests.get(f"{base_url}fixtures/", timeout=30).json()
-        fixtures = [{
-            'id': f['id'], 'event': f.get('event'),
-            'team_h': f['team_h'], 'team_a': f['team_a'],
-            'team_h_name': team_map.get(f['team_h'], str(f['team_h'])),
-            'team_a_name': team_map.get(f['team_a'], str(f['team_a'])),
-            'kickoff_time': f.get('kickoff_time'),
-            'started': f.get('started', False),
-            'finished': f.get('finished', False),
-            'team_h_score': f.get('team_h_score'),
-            'team_a_score': f.get('team_a_score')
-        } for f in fixtures_data]
-        
-        db.fixtures.delete_many({})
-        db.fixtures.insert_many(fixtures)
+        await asyncio.to_thread(save_fpl_data, db, bootstrap, fixtures_data)
         
-        lineup_entries = []
-        for f in fixtures_data:
-            for s in f.get('stats', []):
-                if s.get('identifier') == 'minutes':
-                    for side in ('h', 'a'):
-                        for p in s.get(side, []):
-                            lineup_entries.append({
-                                "match_id": f['id'],
-                                "player_id": p['element'],
-                                "minutes": p['value']
-                            })
-        
-        db.lineups.delete_many({})
-        if lineup_entries:
-            db.lineups.insert_many(lineup_entries)
-        
-        today_events = get_today_sofascore_matches()
-        for event in today_events:
-            sofa_lineup = fetch_sofascore_lineup(event['id'])
-            if sofa_lineup:
-                db.tactical_data.update_one(
-                    {"match_id": event['id']},
-                    {"$set": {
-                        "home_team": event['homeTeam']['name'],
-                        "away_team": event['awayTeam']['name'],
-                        "players": sofa_lineup,
-                        "last_updated": datetime.now(timezone.utc)
-                    }},
-                    upsert=True
-                )
+        today_events = await asyncio.to_thread(get_today_sofascore_matches)
+        # A finished match's lineup can't change, so skip refetching ones already stored
+        stored_ids = set(await asyncio.to_thread(
+            db.tactical_data.distinct, 'match_id', {'match_id': {'$in': [e['id'] for e in today_events]}}
+        ))
+        today_events = [e for e in today_events
+                        if not (e['id'] in stored_ids and e.get('status', {}).get('type') == 'finished')]
+        lineups = await fetch_sofascore_lineups(today_events)
+        await asyncio.to_thread(save_tactical_lineups, db, list(zip(today_events, lineups)))
         
         await update.message.reply_text("✅ Sync complete!")
     except Exception as e:
         logging.error(f"Update error: {e}")
         await update.message.reply_text(f"❌ Failed: {str(e)}")
-    finally:
-        client.close()
 
 async def check(update: Update, context: CallbackContext):
-    client, db = get_db()
-    if tactical := db.tactical_data.find_one(sort=[("last_updated", -1)]):
-        msg = f"📊 *{tactical['home_team']} vs {tactical['away_team']}*\n\n"
-        msg += detect_tactical_oop(db, tactical['match_id']) or "✅ No shifts"
-        await update.message.reply_text(msg, parse_mode="Markdown")
+    db = get_db()
+    # Blocking Mongo reads run in a worker thread so other updates keep flowing
+    if msg := await asyncio.to_thread(build_check_report, db):
+        await update.message.reply_text(msg, parse_mode=ParseMode.MARKDOWN)
     else:
         await update.message.reply_text("No data yet. Run /update first.")
-    client.close()
 
 async def builder(update: Update, context: CallbackContext):
-    client, db = get_db()
-    await update.message.reply_text("📊 Select fixture:", reply_markup=InlineKeyboardMarkup(show_fixture_menu(db)))
-    client.close()
+    db = get_db()
+    markup = await asyncio.to_thread(fixture_menu_markup, db)
+    await update.message.reply_text("📊 Select fixture:", reply_markup=markup)
 
 async def gw_accumulator(update: Update, context: CallbackContext):
-    client, db = get_db()
-    msg = generate_gw_accumulator(db)
-    await update.message.reply_text(msg, parse_mode="Markdown")
-    client.close()
+    db = get_db()
+    msg = await asyncio.to_thread(generate_gw_accumulator, db)
+    await update.message.reply_text(msg, parse_mode=ParseMode.MARKDOWN)
+
+# Last /status banner; bursts of /status within STATUS_CACHE_TTL reuse it
+_status_cache = {'ts': 0.0, 'msg': None}
 
 async def status(update: Update, context: CallbackContext):
-    client, db = get_db()
-    latest = db.tactical_data.find_one(sort=[("last_updated", -1)])
-    last_update = latest['last_updated'].strftime("%Y-%m-%d %H:%M UTC") if latest else "Never"
-    
-    await update.message.reply_text(
-        f"🤖 *Bot Status*\n\n"
-        f"Players: {db.players.count_documents({})}\n"
-        f"Upcoming: {db.fixtures.count_documents({'started': False, 'finished': False})}\n"
-        f"Users: {db.users.count_documents({})}\n"
-        f"Last update: {last_update}",
-        parse_mode="Markdown"
-    )
-    client.close()
+    if _status_cache['msg'] is None or time.time() - _status_cache['ts'] >= STATUS_CACHE_TTL:
+        msg = await single_flight("status", lambda: build_status_report(get_db()))
+        _status_cache.update(ts=time.time(), msg=msg)
+    await update.message.reply_text(_status_cache['msg'], parse_mode=ParseMode.MARKDOWN)
 
 async def update_standings_command(update: Update, context: CallbackContext):
-    client, db = get_db()
+    await run_exclusive_job(update, context, "standings", sync_standings)
+
+async def sync_standings(update: Update):
+    db = get_db()
     try:
         await update.message.reply_text("🔄 Fetching xG data from Understat...")
-        rows = fetch_pl_standings()
-        save_standings_to_mongo(db, rows)
+        # An explicit refresh must see Understat's latest numbers, not the cached scrape
+        rows = await asyncio.to_thread(fetch_pl_standings, force=True)
+        await asyncio.to_thread(save_standings_to_mongo, db, rows)
         await update.message.reply_text("✅ Standings updated with xG data!")
     except Exception as e:
         logging.error(f"Standings update error: {e}")
         await update.message.reply_text(f"❌ Failed: {str(e)}")
-    finally:
-        client.close()
 
 async def handle_callbacks(update: Update, context: CallbackContext):
     query = update.callback_query
     await query.answer()
-    client, db = get_db()
+    db = get_db()
     
-    if query.data.startswith("select_"):
-        fixture_id = int(query.data.split("_")[1])
-        if fixture := db.fixtures.find_one({"id": fixture_id}):
-            msg = f"📊 *{fixture['team_h_name']} vs {fixture['team_a_name']}*\n\n"
-            msg += generate_fixture_bet_builder(fixture, db)
-            await query.edit_message_text(msg, parse_mode="Markdown")
+    if (fixture_ref := query.data.removeprefix("select_")) != query.data:
+        fixture_id = int(fixture_ref)
+        if msg := await single_flight(("report", fixture_id),
+                                      lambda: asyncio.to_thread(build_fixture_report, db, fixture_id)):
+            await query.edit_message_text(msg, parse_mode=ParseMode.MARKDOWN)
         else:
             await query.edit_message_text("❌ Fixture not found")
-    
-    client.close()
 
-# --- FLASK APP ---
-app = Flask(__name__)
+# --- HEALTH CHECK ---
+async def index(request):
+    return web.Response(text="Bot Running!")
 
-@app.route('/')
-def index():
-    return "Bot Running!"
+async def start_health_server(application):
+    """Serve the health route on the bot's own event loop"""
+    health_app = web.Application()
+    health_app.router.add_get('/', index)
+    runner = web.AppRunner(health_app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", int(os.environ.get("PORT", 5000))).start()
+    application.bot_data['health_runner'] = runner
+
+async def stop_health_server(application):
+    await application.bot_data['health_runner'].cleanup()
 
 # --- MAIN ---
+async def post_init(application):
+    await start_health_server(application)
+    start_monitor(application)
+
+async def post_shutdown(application):
+    await stop_monitor(application)
+    await stop_health_server(application)
+
 if __name__ == "__main__":
     if not all([MONGODB_URI, TELEGRAM_TOKEN]):
         raise ValueError("MONGODB_URI and BOT_TOKEN required")
     
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("update", update_data))
     application.add_handler(CommandHandler("check", check))
@@ -802,8 +1200,8 @@ if __name__ == "__main__":
     application.add_handler(CommandHandler("update_standings", update_standings_command))
     application.add_handler(CallbackQueryHandler(handle_callbacks))
     
-    threading.Thread(target=run_monitor, daemon=True).start()
-    threading.Thread(target=lambda: app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000))), daemon=True).start()
+    _CLIENT.admin.command('ping')  # fail fast on a bad URI and warm the pool before polling
+    ensure_indexes(get_db())
     
     logging.info("Starting PL Lineup Bot...")
-    application.run_polling()
+    application.run_polling(drop_pending_updates=True, poll_interval=0.0, timeout=30)